@@ -9,17 +9,27 @@ EMBED_API_URL = os.environ.get("EMBED_API_URL")  # e.g., OpenAI compat endpoint
 EMBED_API_KEY = os.environ.get("EMBED_API_KEY")
 
 
+EMBED_BATCH_SIZE = 2048  # OpenAI's max inputs per embeddings request
+
+
 def embed(texts: List[str]) -> List[List[float]]:
-    """Embed texts using OpenAI-compatible API."""
+    """Embed texts using OpenAI-compatible API, up to EMBED_BATCH_SIZE texts per request."""
     if not EMBED_API_URL or not EMBED_API_KEY:
         raise RuntimeError("Set EMBED_API_URL and EMBED_API_KEY for embeddings.")
     
+    embeddings: List[List[float]] = []
+    # One pooled client so every batch reuses the same connection
+    with httpx.Client(headers={"Authorization": f"Bearer {EMBED_API_KEY}"}, timeout=60) as client:
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            embeddings.extend(_embed_batch(client, texts[start : start + EMBED_BATCH_SIZE]))
+    return embeddings
+
+
+def _embed_batch(client: httpx.Client, texts: List[str]) -> List[List[float]]:
     # OpenAI embeddings endpoint format
-    resp = httpx.post(
+    resp = client.post(
         EMBED_API_URL,
-        headers={"Authorization": f"Bearer {EMBED_API_KEY}"},
         json={"model": EMBED_MODEL, "input": texts},
-        timeout=60,
     )
     
     if resp.status_code == 401:
@@ -36,4 +46,3 @@ def embed(texts: List[str]) -> List[List[float]]:
         return data["embeddings"]
     else:
         raise ValueError(f"Unexpected API response format: {list(data.keys())}")
-
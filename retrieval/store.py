@@ -1,9 +1,13 @@
-import json
+import hashlib
+import os
+import pickle
+import tempfile
 from pathlib import Path
 from typing import List, Tuple
 
 import faiss
 import numpy as np
+import orjson
 
 
 class VectorStore:
@@ -28,6 +32,88 @@ class VectorStore:
 
 
 def load_jsonl(path: Path) -> list[dict]:
-    with path.open() as f:
-        return [json.loads(line) for line in f]
+    with path.open("rb") as f:
+        return [orjson.loads(line) for line in f]
 
+
+def problem_text(item: dict) -> str:
+    """Embedding text for a problem: question + all solution styles."""
+    question = item.get("question", "")
+    solutions = item.get("solutions", {})
+    text = f"{question}\n\n"
+    text += f"Direct: {solutions.get('direct', '')}\n"
+    text += f"Step-by-step: {solutions.get('step_by_step', '')}\n"
+    text += f"Intuitive: {solutions.get('intuitive', '')}\n"
+    text += f"Shortcut: {solutions.get('shortcut', '')}"
+    return text
+
+
+def _load_pickle(path: Path):
+    """Unpickle a cache file; None when it is missing or unreadable (e.g. truncated by a killed run)."""
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (EOFError, pickle.UnpicklingError):
+        return None
+
+
+def _dump_pickle(path: Path, obj) -> None:
+    """Pickle obj via a temp file + os.replace so a killed run never leaves a truncated cache file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_or_build(
+    data_path: Path,
+    store_path: Path | None = None,
+    limit: int | None = None,
+    cache_dir: Path = Path("data/_cache"),
+) -> tuple[VectorStore, list[dict]]:
+    """
+    Load a prebuilt store from store_path, or embed data_path (first `limit` items).
+    Built stores are pickled under cache_dir keyed by the data file's content and the
+    embedding model, so the embedding API is only called again when the data changes.
+    """
+    if store_path is not None and store_path.exists():
+        with open(store_path, "rb") as f:
+            data = pickle.load(f)
+        return data["store"], data["items"]
+
+    from retrieval.embed import EMBED_MODEL, embed
+
+    digest = hashlib.sha256(data_path.read_bytes() + f"\0{EMBED_MODEL}\0{limit}".encode()).hexdigest()[:16]
+    cache_file = cache_dir / f"{digest}.pkl"
+    data = _load_pickle(cache_file)
+    if data is not None:
+        return data["store"], data["items"]
+
+    items = load_jsonl(data_path)[:limit]
+    if not items:
+        return VectorStore(dim=1), []
+
+    # Per-text embedding cache: when a few problems are added, only those are embedded
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    texts = [problem_text(it) for it in items]
+    text_keys = [hashlib.sha256(t.encode()).hexdigest() for t in texts]
+    embeddings_file = cache_dir / f"embeddings_{hashlib.sha256(EMBED_MODEL.encode()).hexdigest()[:16]}.pkl"
+    # An unreadable cache starts over empty; only the texts requested now get re-embedded
+    known: dict[str, list[float]] = _load_pickle(embeddings_file) or {}
+    missing = {key: text for key, text in zip(text_keys, texts) if key not in known}
+    if missing:
+        known.update(zip(missing, embed(list(missing.values()))))
+        _dump_pickle(embeddings_file, known)
+
+    embeddings = [known[key] for key in text_keys]
+    store = VectorStore(len(embeddings[0]))
+    store.add(embeddings, items)
+
+    _dump_pickle(cache_file, {"store": store, "items": items})
+    return store, items
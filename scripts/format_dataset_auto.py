@@ -5,11 +5,13 @@ Extracts problems from drafts and uses LLM to generate 4 solution styles.
 
 import argparse
 import json
+import mmap
 import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 import httpx
+import orjson
 import time
 
 SYSTEM_PROMPT = (
@@ -23,6 +25,19 @@ SYSTEM_PROMPT = (
     "If the answer is not provided, calculate it from the given information."
 )
 
+# Static parts of the formatting request; only the user message changes per call
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+_BASE_PAYLOAD = {
+    "model": "gpt-4o-mini",
+    "max_tokens": 1500,
+    "temperature": 0.3,
+    "response_format": {"type": "json_object"},
+}
+
+# Keywords marking a solution-step line (matched against lowercased lines).
+# A single alternation regex finds any keyword in one scan of the line.
+_SOL_RE = re.compile(r'solution|step|calculate|formula|lcm|t_a|t_b')
+
 
 def extract_problem_from_content(content: str) -> Optional[Dict[str, str]]:
     """Extract structured problem info from vision LLM output."""
@@ -38,7 +53,9 @@ def extract_problem_from_content(content: str) -> Optional[Dict[str, str]]:
         "blank", "does not contain", "no specific problem", "no visible content",
         "not provided", "not visible", "not shown", "not mentioned"
     ]
-    if any(indicator in content.lower()[:200] for indicator in skip_indicators):
+    content_lower = content.lower()
+    head_lower = content_lower[:200]
+    if any(indicator in head_lower for indicator in skip_indicators):
         return None
     
     # Try to extract question - look for actual questions
@@ -81,9 +98,8 @@ def extract_problem_from_content(content: str) -> Optional[Dict[str, str]]:
     # Extract solution steps
     if any(kw in content for kw in ["T_A", "T_B", "LCM", "=", "calculate", "formula"]):
         solution_lines = []
-        for line in content.split('\n'):
-            line_lower = line.lower()
-            if any(kw in line_lower for kw in ['solution', 'step', 'calculate', 'formula', 'lcm', 't_a', 't_b']) and '=' in line:
+        for line, line_lower in zip(content.split('\n'), content_lower.split('\n')):
+            if '=' in line and _SOL_RE.search(line_lower):
                 solution_lines.append(line.strip())
         if solution_lines:
             problem["solution_steps"] = "\n".join(solution_lines[:8])
@@ -130,16 +146,7 @@ Generate four solution styles in JSON format with these exact keys:
 
 Return only valid JSON."""
 
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        "max_tokens": 1500,
-        "temperature": 0.3,
-        "response_format": {"type": "json_object"},
-    }
+    payload = {**_BASE_PAYLOAD, "messages": [_SYSTEM_MSG, {"role": "user", "content": user_prompt}]}
     
     max_retries = 5
     base_wait = 5
@@ -179,26 +186,44 @@ Return only valid JSON."""
     raise Exception("Max retries exceeded")
 
 
+def iter_jsonl_lines(path: Path) -> Iterator[bytes]:
+    """Yield raw JSONL lines from a memory-mapped file (no text decoding)."""
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter(mm.readline, b'')
+
+
 def process_draft_file(draft_file: Path, topic: str, api_url: str, api_key: str, out_file: Path, start_id: int = 1):
     """Process a draft file and format problems."""
     problems_found = []
     
     print(f"Reading {draft_file}...")
-    with open(draft_file, 'r') as f:
-        for line in f:
-            try:
-                data = json.loads(line.strip())
-                content = data.get("draft", {}).get("choices", [{}])[0].get("message", {}).get("content", "")
-                
-                # Extract problem
-                problem = extract_problem_from_content(content)
-                if problem:
-                    problem["source_frame"] = data.get("frame", data.get("source", "unknown"))
-                    problem["raw_content"] = content[:500]  # Keep some raw for reference
-                    problems_found.append(problem)
-            except Exception as e:
-                print(f"  ⚠️  Error processing line: {e}")
-                continue
+    for line in iter_jsonl_lines(draft_file):
+        # Cheap shape check so blank/garbage lines never reach the parser
+        line = line.strip()
+        if not line.startswith(b'{'):
+            continue
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            print(f"  ⚠️  Error processing line: {e}")
+            continue
+        try:
+            content = data.get("draft", {}).get("choices", [{}])[0].get("message", {}).get("content", "")
+            if not isinstance(content, str):
+                raise TypeError(f"content is {type(content).__name__}, not str")
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            print(f"  ⚠️  Error processing line: {e!r}")
+            continue
+        
+        # Extract problem
+        problem = extract_problem_from_content(content)
+        if problem:
+            problem["source_frame"] = data.get("frame", data.get("source", "unknown"))
+            problem["raw_content"] = content[:500]  # Keep some raw for reference
+            problems_found.append(problem)
     
     print(f"  Found {len(problems_found)} problems to format")
     
@@ -11,6 +11,16 @@ from typing import Dict, List
 import httpx
 
 
+def _between(text: str, start: str, end: str = "###") -> str:
+    """Return the stripped text after `start` up to the next `end` marker ("" if absent)."""
+    i = text.find(start)
+    if i < 0:
+        return ""
+    i += len(start)
+    j = text.find(end, i)
+    return (text[i:j] if j >= 0 else text[i:]).strip()
+
+
 def format_puzzle_to_canonical(puzzle_data: Dict, llm_api_url: str, llm_api_key: str) -> Dict:
     """Format a puzzle draft into canonical structure with 4 solution styles."""
     
@@ -18,26 +28,10 @@ def format_puzzle_to_canonical(puzzle_data: Dict, llm_api_url: str, llm_api_key:
     puzzle_num = puzzle_data.get("puzzle_num", 0)
     puzzle_type = puzzle_data.get("puzzle_type", "")
     
-    # Extract question from draft
-    question = ""
-    if "### Puzzle/Question Statement:" in draft_content:
-        parts = draft_content.split("### Puzzle/Question Statement:")
-        if len(parts) > 1:
-            question = parts[1].split("###")[0].strip()
-    
-    # Extract answer if available
-    answer = ""
-    if "### Answer:" in draft_content:
-        parts = draft_content.split("### Answer:")
-        if len(parts) > 1:
-            answer = parts[1].split("###")[0].strip()
-    
-    # Extract solution approach
-    solution_approach = ""
-    if "### Solution Approach:" in draft_content:
-        parts = draft_content.split("### Solution Approach:")
-        if len(parts) > 1:
-            solution_approach = parts[1].split("###")[0].strip()
+    # Extract sections from draft
+    question = _between(draft_content, "### Puzzle/Question Statement:")
+    answer = _between(draft_content, "### Answer:")
+    solution_approach = _between(draft_content, "### Solution Approach:")
     
     # Use LLM to generate 4 solution styles
     prompt = f"""You are formatting a CAT LRDI puzzle solution. Given the extracted content, generate 4 solution styles:
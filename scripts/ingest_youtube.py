@@ -11,37 +11,43 @@ Prereqs:
 
 import argparse
 import json
+import os
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from pathlib import Path
 
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
 
 
-def download_video(url: str, out_dir: Path) -> Path:
+def download_videos(urls: list[str], out_dir: Path) -> list[tuple[str, Path, dict]]:
+    """Download every URL through one YoutubeDL instance; returns (url, path, info) for each success."""
     out_dir.mkdir(parents=True, exist_ok=True)
     ydl_opts = {
         "outtmpl": str(out_dir / "%(id)s.%(ext)s"),
         "format": "mp4/bestaudio/best",
     }
+    downloads = []
     with YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        filename = Path(ydl.prepare_filename(info))
-    return filename
-
-
-def extract_transcript(url: str) -> dict | None:
-    """Pull auto-captions via yt-dlp; returns None if unavailable."""
-    try:
-        with YoutubeDL({"writesubtitles": True, "writeautomaticsub": True, "skip_download": True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            subs = info.get("subtitles") or info.get("automatic_captions") or {}
-            # Pick english-ish track if present.
-            for key in ("en", "en-US", "en-GB"):
-                if key in subs:
-                    return {"url": url, "language": key, "tracks": subs[key]}
-    except Exception:
-        return None
+        for url in urls:
+            # One bad URL must not abort the rest of the batch
+            try:
+                info = ydl.extract_info(url, download=True)
+            except DownloadError as e:
+                print(f"⚠️  Skipping {url}: {e}")
+                continue
+            downloads.append((url, Path(ydl.prepare_filename(info)), info))
+    return downloads
+
+
+def transcript_from_info(url: str, info: dict) -> dict | None:
+    """Pick an english-ish caption track from yt-dlp info; returns None if unavailable."""
+    subs = info.get("subtitles") or info.get("automatic_captions") or {}
+    for key in ("en", "en-US", "en-GB"):
+        if key in subs:
+            return {"url": url, "language": key, "tracks": subs[key]}
     return None
 
 
@@ -49,6 +55,7 @@ def extract_frames(video_path: Path, out_dir: Path, every_seconds: int = 2) -> l
     out_dir.mkdir(parents=True, exist_ok=True)
     cmd = [
         "ffmpeg",
+        "-nostdin",  # parallel runs must not compete for the terminal's stdin
         "-i",
         str(video_path),
         "-vf",
@@ -62,29 +69,64 @@ def extract_frames(video_path: Path, out_dir: Path, every_seconds: int = 2) -> l
     return sorted(out_dir.glob("frame_*.jpg"))
 
 
+def try_extract_frames(video_path: Path, out_dir: Path, every_seconds: int = 2) -> list[Path] | None:
+    """extract_frames for batch runs: reports an ffmpeg failure and returns None instead of raising."""
+    try:
+        return extract_frames(video_path, out_dir, every_seconds)
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️  Skipping {video_path}: ffmpeg exited with status {e.returncode}")
+        return None
+
+
 def main():
     parser = argparse.ArgumentParser(description="Download YT, extract transcript and frames.")
-    parser.add_argument("--url", required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--url")
+    source.add_argument("--urls", type=Path, help="Text file with one URL per line")
     parser.add_argument("--every-seconds", type=int, default=2)
     parser.add_argument("--out", type=Path, default=Path("data/raw"))
     args = parser.parse_args()
 
+    if args.url:
+        urls = [args.url]
+    else:
+        urls = [line.strip() for line in args.urls.read_text().splitlines() if line.strip()]
+
     video_out = args.out / "videos"
     frames_out = args.out / "frames"
     meta_out = args.out / "meta"
 
-    video_path = download_video(args.url, video_out)
-    frames = extract_frames(video_path, frames_out / video_path.stem, args.every_seconds)
-    transcript = extract_transcript(args.url)
+    if not urls:
+        print("No URLs to ingest")
+        return
 
-    meta_out.mkdir(parents=True, exist_ok=True)
-    meta_file = meta_out / f"{video_path.stem}.json"
-    meta = {"url": args.url, "video_path": str(video_path), "frames_dir": str(frames_out / video_path.stem), "transcript": transcript}
-    meta_file.write_text(json.dumps(meta, indent=2))
+    downloads = download_videos(urls, video_out)
+    if not downloads:
+        raise SystemExit("No videos downloaded")
+
+    # ffmpeg runs as a subprocess, so threads are enough to decode videos in parallel
+    video_paths = [video_path for _, video_path, _ in downloads]
+    frame_dirs = [frames_out / video_path.stem for video_path in video_paths]
+    with ThreadPoolExecutor(max_workers=min(len(video_paths), os.cpu_count() or 1)) as pool:
+        all_frames = list(pool.map(try_extract_frames, video_paths, frame_dirs, repeat(args.every_seconds)))
 
-    print(f"Downloaded: {video_path}")
-    print(f"Frames: {len(frames)} -> {frames_out / video_path.stem}")
-    print(f"Meta: {meta_file}")
+    meta_out.mkdir(parents=True, exist_ok=True)
+    for (url, video_path, info), frames_dir, frames in zip(downloads, frame_dirs, all_frames):
+        if frames is None:
+            continue
+        transcript = transcript_from_info(url, info)
+        meta_file = meta_out / f"{video_path.stem}.json"
+        meta = {"url": url, "video_path": str(video_path), "frames_dir": str(frames_dir), "transcript": transcript}
+        meta_file.write_text(json.dumps(meta, indent=2))
+
+        print(f"Downloaded: {video_path}")
+        print(f"Frames: {len(frames)} -> {frames_dir}")
+        print(f"Meta: {meta_file}")
+
+    # Successful videos are kept above, but a partial batch still exits non-zero
+    failed = len(urls) - sum(frames is not None for frames in all_frames)
+    if failed:
+        raise SystemExit(f"{failed} of {len(urls)} videos failed")
 
 
 if __name__ == "__main__":
@@ -5,6 +5,8 @@ Merge all LRDI/DILR datasets into one combined file.
 import json
 from pathlib import Path
 
+import orjson
+
 
 def merge_datasets():
     """Merge all LRDI seed files into one combined dataset."""
@@ -32,21 +34,29 @@ def merge_datasets():
             continue
         
         count = 0
-        with open(path, 'r') as f:
-            for line in f:
-                if line.strip():
-                    try:
-                        problem = json.loads(line)
-                        # Update ID to include source for tracking
-                        original_id = problem.get('id', 'unknown')
-                        source = path.stem.replace('seed_', '')
-                        problem['id'] = f"dilr_{original_id}" if not original_id.startswith('dilr_') else original_id
-                        problem['source'] = source
-                        all_problems.append(problem)
-                        count += 1
-                    except Exception as e:
-                        print(f"⚠️  Error parsing line in {path.name}: {e}")
-                        continue
+        # One read() for the whole file; seed files are small enough to hold in memory
+        for line in path.read_bytes().splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith(b'{'):
+                print(f"⚠️  Error parsing line in {path.name}: not a JSON object: {line[:60]!r}")
+                continue
+            try:
+                problem = orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                print(f"⚠️  Error parsing line in {path.name}: {e}")
+                continue
+            # Update ID to include source for tracking
+            original_id = problem.get('id', 'unknown')
+            if not isinstance(original_id, str):
+                print(f"⚠️  Error parsing line in {path.name}: id {original_id!r} is not a string")
+                continue
+            source = path.stem.replace('seed_', '')
+            problem['id'] = f"dilr_{original_id}" if not original_id.startswith('dilr_') else original_id
+            problem['source'] = source
+            all_problems.append(problem)
+            count += 1
         
         print(f"✅ {path.name}: {count} problems")
     
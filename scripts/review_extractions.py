@@ -3,25 +3,141 @@ Review script to analyze extracted problems from all videos.
 Shows summary, best problems, and statistics.
 """
 
-import json
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from collections import defaultdict
+from typing import Iterator
 
-def extract_problem_info(content: str) -> dict:
-    """Extract key information from content."""
-    info = {
-        "has_question": any(kw in content.lower() for kw in ["question", "problem", "after how", "if ratio"]),
-        "has_data": any(kw in content.lower() for kw in ["120", "m/s", "speed", "circumference", "diameter", "km/h"]),
-        "has_solution": any(kw in content.lower() for kw in ["solution", "step", "calculate", "formula", "answer"]),
-        "has_formula": any(kw in content.lower() for kw in ["p+q", "p-q", "lcm", "relative speed", "ratio"]),
-    }
-    return info
+import orjson
+import zstandard as zstd
+
+# Stats cache keyed by file path + mtime + size; bump the version when the scan logic changes
+REVIEW_CACHE_DIR = Path("data/.review_cache")
+REVIEW_CACHE_VERSION = 4
+# Only the first few best problems are ever printed, so workers return no more than this
+BEST_PREVIEW_LIMIT = 10
+
+# Per-record feature bits
+HAS_QUESTION = 1 << 0
+HAS_DATA = 1 << 1
+HAS_SOLUTION = 1 << 2
+HAS_FORMULA = 1 << 3
+RATIO_PQ = 1 << 4
+RELATIVE_SPEED = 1 << 5
+LCM = 1 << 6
+MEET_START = 1 << 7
+DIRECTION = 1 << 8
+# Partial bits for concepts that need two keywords to co-occur
+_RATIO = 1 << 9
+_PQ = 1 << 10
+_MEET = 1 << 11
+_START = 1 << 12
+
+CONCEPT_LABELS = (
+    (RATIO_PQ, "Speed Ratio (P:Q)"),
+    (RELATIVE_SPEED, "Relative Speed"),
+    (LCM, "LCM"),
+    (MEET_START, "Meeting at Starting Point"),
+    (DIRECTION, "Direction-based Problems"),
+)
+CONCEPT_MASK = RATIO_PQ | RELATIVE_SPEED | LCM | MEET_START | DIRECTION
+
+_KEYWORD_BITS = defaultdict(int)
+for _bit, _keywords in (
+    (HAS_QUESTION, ("question", "problem", "after how", "if ratio")),
+    (HAS_DATA, ("120", "m/s", "speed", "circumference", "diameter", "km/h")),
+    (HAS_SOLUTION, ("solution", "step", "calculate", "formula", "answer")),
+    (HAS_FORMULA, ("p+q", "p-q", "lcm", "relative speed", "ratio")),
+    (_RATIO, ("ratio",)),
+    (_PQ, ("p:q", "p+q")),
+    (RELATIVE_SPEED, ("relative speed",)),
+    (LCM, ("lcm", "least common multiple")),
+    (_MEET, ("meet",)),
+    (_START, ("starting", "point")),
+    (DIRECTION, ("opposite direction", "same direction")),
+):
+    for _kw in _keywords:
+        _KEYWORD_BITS[_kw] |= _bit
+
+# Zero-width lookahead so overlapping keywords ("speed" inside "relative speed")
+# are all reported from a single case-insensitive pass over the content
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for kw in sorted(_KEYWORD_BITS, key=len, reverse=True)) + "))",
+    re.IGNORECASE,
+)
+
+# Flattens line breaks and tabs so snippets print on a single line
+_NL_TO_SPACE = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
+
+def scan_flags(content: str) -> int:
+    """Return the feature bitmask for content."""
+    flags = 0
+    for kw in _KEYWORD_RE.findall(content):
+        flags |= _KEYWORD_BITS.get(kw.lower(), 0)
+    if flags & _RATIO and flags & _PQ:
+        flags |= RATIO_PQ
+    if flags & _MEET and flags & _START:
+        flags |= MEET_START
+    return flags
+
+def concept_labels(mask: int) -> list[str]:
+    """Map concept bits back to their display labels."""
+    return [label for bit, label in CONCEPT_LABELS if mask & bit]
+
+def iter_jsonl_lines(path: Path, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """Yield raw JSONL lines by scanning binary chunks for newlines (no text decoding).
+    
+    Files ending in .zst are decompressed on the fly; a truncated tail ends the scan.
+    """
+    buf = bytearray()
+    with open(path, 'rb') as raw:
+        f = zstd.ZstdDecompressor().stream_reader(raw, read_across_frames=True) if path.suffix == ".zst" else raw
+        try:
+            while chunk := f.read(chunk_size):
+                buf += chunk
+                start = 0
+                while (nl := buf.find(b'\n', start)) >= 0:
+                    yield bytes(buf[start:nl])
+                    start = nl + 1
+                del buf[:start]
+        except zstd.ZstdError:
+            return
+    if buf:
+        yield bytes(buf)
 
 def review_draft_file(draft_file: Path) -> dict:
-    """Review a single draft file and extract statistics."""
+    """Review a single draft file, reusing cached stats while the file is unchanged."""
     if not draft_file.exists():
         return None
     
+    st = draft_file.stat()
+    key = f"{REVIEW_CACHE_VERSION}:{draft_file.resolve()}:{st.st_mtime_ns}:{st.st_size}"
+    cache_file = REVIEW_CACHE_DIR / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+    if cache_file.exists():
+        try:
+            return orjson.loads(cache_file.read_bytes())
+        except orjson.JSONDecodeError:
+            pass  # Unreadable entry (e.g. an interrupted write); rescan and overwrite it
+    
+    stats = scan_draft_file(draft_file)
+    REVIEW_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Temp file + os.replace so a run killed mid-write never leaves a truncated entry
+    fd, tmp = tempfile.mkstemp(dir=REVIEW_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(stats))
+        os.replace(tmp, cache_file)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return stats
+
+def scan_draft_file(draft_file: Path) -> dict:
+    """Scan a single draft file and extract statistics."""
     stats = {
         "total_entries": 0,
         "transcript_entries": 0,
@@ -29,56 +145,51 @@ def review_draft_file(draft_file: Path) -> dict:
         "problems_with_question": 0,
         "problems_with_data": 0,
         "problems_with_solution": 0,
-        "best_problems": [],
-        "concepts_found": set(),
+        "best_preview": [],
+        "best_total": 0,
+        "concepts_mask": 0,
     }
     
-    with open(draft_file, 'r') as f:
-        for line in f:
-            try:
-                data = json.loads(line.strip())
-                stats["total_entries"] += 1
-                
-                if data.get("type") == "transcript":
-                    stats["transcript_entries"] += 1
-                elif data.get("type") == "frame":
-                    stats["frame_entries"] += 1
-                
-                content = data.get("draft", {}).get("choices", [{}])[0].get("message", {}).get("content", "")
-                info = extract_problem_info(content)
-                
-                if info["has_question"]:
-                    stats["problems_with_question"] += 1
-                if info["has_data"]:
-                    stats["problems_with_data"] += 1
-                if info["has_solution"]:
-                    stats["problems_with_solution"] += 1
-                
-                # Track concepts
-                if "ratio" in content.lower() and ("p:q" in content.lower() or "p+q" in content.lower()):
-                    stats["concepts_found"].add("Speed Ratio (P:Q)")
-                if "relative speed" in content.lower():
-                    stats["concepts_found"].add("Relative Speed")
-                if "lcm" in content.lower() or "least common multiple" in content.lower():
-                    stats["concepts_found"].add("LCM")
-                if "meet" in content.lower() and ("starting" in content.lower() or "point" in content.lower()):
-                    stats["concepts_found"].add("Meeting at Starting Point")
-                if "opposite direction" in content.lower() or "same direction" in content.lower():
-                    stats["concepts_found"].add("Direction-based Problems")
-                
-                # Collect best problems (those with question + data)
-                if info["has_question"] and info["has_data"]:
-                    frame_name = data.get("frame", "transcript")
-                    snippet = content[:300].replace("\n", " ")
-                    stats["best_problems"].append({
-                        "source": frame_name,
-                        "snippet": snippet,
-                        "full_content": content[:500] if len(content) > 500 else content
-                    })
-                    
-            except Exception as e:
-                continue
-    
+    for line in iter_jsonl_lines(draft_file):
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue
+        stats["total_entries"] += 1
+        if not isinstance(data, dict):
+            continue
+        
+        entry_type = data.get("type")
+        if entry_type == "transcript":
+            stats["transcript_entries"] += 1
+        elif entry_type == "frame":
+            stats["frame_entries"] += 1
+        
+        try:
+            content = data["draft"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            continue
+        if not isinstance(content, str) or not content:
+            continue
+        
+        flags = scan_flags(content)
+        stats["problems_with_question"] += bool(flags & HAS_QUESTION)
+        stats["problems_with_data"] += bool(flags & HAS_DATA)
+        stats["problems_with_solution"] += bool(flags & HAS_SOLUTION)
+        stats["concepts_mask"] |= flags & CONCEPT_MASK
+        
+        # Collect best problems (those with question + data)
+        if flags & HAS_QUESTION and flags & HAS_DATA:
+            stats["best_total"] += 1
+            if len(stats["best_preview"]) < BEST_PREVIEW_LIMIT:
+                frame_name = data.get("frame", "transcript")
+                snippet = content[:300].translate(_NL_TO_SPACE)
+                stats["best_preview"].append({
+                    "source": frame_name,
+                    "snippet": snippet,
+                    "full_content": content[:500]
+                })
+
     return stats
 
 def main():
@@ -96,23 +207,32 @@ def main():
     print()
     
     all_stats = {}
-    all_best_problems = []
+    best_preview = []
+    best_total = 0
     
+    # Files are independent and the scan is CPU-bound, so review them in parallel
+    tasks = []
     for video_file in video_files:
         draft_file = drafts_dir / video_file
-        video_id = video_file.replace("_drafts.jsonl", "")
-        
+        compressed = draft_file.with_name(f"{video_file}.zst")
+        if not draft_file.exists() and compressed.exists():
+            draft_file = compressed
+        tasks.append((video_file.replace("_drafts.jsonl", ""), draft_file))
+    with ProcessPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as pool:
+        results = list(pool.map(review_draft_file, [draft_file for _, draft_file in tasks]))
+    
+    for (video_id, _), stats in zip(tasks, results):
         print(f"📹 Video: {video_id}")
         print("-" * 80)
         
-        stats = review_draft_file(draft_file)
         if not stats:
             print("  ⚠️  File not found")
             print()
             continue
         
         all_stats[video_id] = stats
-        all_best_problems.extend([(video_id, p) for p in stats["best_problems"]])
+        best_preview.extend((video_id, p) for p in stats["best_preview"][:BEST_PREVIEW_LIMIT - len(best_preview)])
+        best_total += stats["best_total"]
         
         print(f"  Total entries: {stats['total_entries']}")
         print(f"    • Transcripts: {stats['transcript_entries']}")
@@ -124,9 +244,10 @@ def main():
         print(f"    • With solution: {stats['problems_with_solution']}")
         print()
         
-        if stats["concepts_found"]:
+        concepts = concept_labels(stats["concepts_mask"])
+        if concepts:
             print(f"  Concepts identified:")
-            for concept in sorted(stats["concepts_found"]):
+            for concept in sorted(concepts):
                 print(f"    • {concept}")
         print()
     
@@ -149,14 +270,14 @@ def main():
     print("=" * 80)
     print()
     
-    for idx, (video_id, problem) in enumerate(all_best_problems[:10], 1):
+    for idx, (video_id, problem) in enumerate(best_preview, 1):
         print(f"Problem #{idx} - {video_id} ({problem['source']})")
         print("-" * 80)
         print(problem["snippet"])
         print()
     
-    if len(all_best_problems) > 10:
-        print(f"... and {len(all_best_problems) - 10} more problems")
+    if best_total > len(best_preview):
+        print(f"... and {best_total - len(best_preview)} more problems")
         print()
     
     print("=" * 80)
@@ -8,95 +8,224 @@ This is a stub showing the contract. Wire to DeepSeek/Gemini/OpenAI Vision.
 """
 
 import argparse
+import asyncio
+import bisect
+import io
 import json
+import math
+import os
+import tempfile
 import time
 from pathlib import Path
-from typing import Iterable
+from typing import BinaryIO, Iterable
 
 import base64
 import httpx
+import orjson
+import zstandard as zstd
+from PIL import Image
 
 
-def batched_frames(frames_dir: Path, batch_size: int = 1, skip: int = 0) -> Iterable[list[Path]]:
+SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "You are an educational content analyzer. Your task is to extract mathematical problem-solving content from tutorial video frames.\n\n"
+        "For each frame, identify and extract:\n"
+        "1. Question text: Any problem statement, including multiple choice options (A, B, C, D) if visible\n"
+        "2. Visual elements: Diagrams, tables, circular tracks, speed/distance relationships shown\n"
+        "3. Solution steps: Any mathematical steps, formulas, or reasoning shown on screen\n"
+        "4. Answer: The final answer or option selected if visible\n\n"
+        "Format your response clearly, preserving all numerical values and relationships exactly as shown."
+    ),
+}
+_BASE_PAYLOAD = {
+    "model": "gpt-4o-mini",  # Using gpt-4o-mini for vision (cheaper than gpt-4o)
+    "max_tokens": 800,
+    "temperature": 0.2,
+}
+# Serialized request up to and including the system message; the user message is appended per call
+_PAYLOAD_PREFIX = orjson.dumps({**_BASE_PAYLOAD, "messages": [SYSTEM_MSG]})[:-2] + b","
+_IMAGE_PART_PREFIX = b'{"type":"image_url","image_url":{"url":"data:image/jpeg;base64,'
+_IMAGE_PART_SUFFIX = b'"}}'
+
+TEXT_ONLY_PROMPT = (
+    "Below is a transcript from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
+    "Please analyze the transcript and extract:\n"
+    "- The problem/question discussed\n"
+    "- Any mathematical concepts, formulas, or relationships mentioned\n"
+    "- Solution steps or explanations provided\n"
+    "- The answer if mentioned\n\n"
+    "Transcript:\n"
+)
+FRAME_PROMPT = (
+    "These are screenshots from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
+    "Please analyze the frame(s) and extract:\n"
+    "- The problem/question shown\n"
+    "- Any diagrams or visual representations\n"
+    "- Solution steps or explanations visible\n"
+    "- The answer if shown\n\n"
+    "Transcript context: "
+)
+
+# Frames are shrunk before upload; vision token cost scales with 512px tiles
+FRAME_MAX_DIM = 768
+FRAME_JPEG_QUALITY = 80
+
+# Per-request token cost used to pace requests against the TPM budget.
+# gpt-4o-mini bills a high-detail image as base + per-512px-tile tokens, so a
+# 768px 16:9 frame is 2 tiles (~14K tokens) vs 6 tiles (~37K) at 1080p.
+IMAGE_BASE_TOKENS = 2_833
+IMAGE_TILE_TOKENS = 5_667
+REQUEST_OVERHEAD_TOKENS = 1_200  # prompt text + max_tokens, which also counts toward TPM
+TEXT_ONLY_TOKENS = 2_000
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at tokens_per_minute / 60 per second."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount: int) -> None:
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def sync(self, headers: httpx.Headers) -> None:
+        """Adopt the server's budget from x-ratelimit-* headers, if present."""
+        try:
+            limit = int(headers["x-ratelimit-limit-tokens"])
+            remaining = int(headers["x-ratelimit-remaining-tokens"])
+        except (KeyError, ValueError):
+            return
+        self.capacity = limit
+        self.rate = limit / 60
+        self.tokens = float(remaining)
+        self.updated = time.monotonic()
+
+
+def list_frames(frames_dir: Path) -> list[Path]:
+    """Sorted frame_*.jpg paths; scandir + plain str sort is cheaper than glob + Path sort."""
+    names = [e.name for e in os.scandir(frames_dir) if e.name.startswith("frame_") and e.name.endswith(".jpg")]
+    names.sort()
+    return [frames_dir / name for name in names]
+
+
+def batched_frames(frames: list[Path], batch_size: int = 1, skip: int = 0) -> Iterable[list[Path]]:
     """Process frames in batches. Default 1 frame at a time to avoid token limits."""
-    frames = sorted(frames_dir.glob("frame_*.jpg"))
     if skip > 0:
         frames = frames[skip:]
     for i in range(0, len(frames), batch_size):
         yield frames[i : i + batch_size]
 
 
-def call_vision_api(frames: list[Path], transcript_chunk: str, api_url: str, api_key: str, text_only: bool = False) -> dict:
+def frame_cache_name(path: Path) -> str:
+    """Sidecar base name tied to the source frame's mtime and size, so re-extracted frames never reuse stale output."""
+    st = path.stat()
+    return f"{path.stem}_{st.st_mtime_ns}_{st.st_size}"
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write via a temp file + os.replace so a killed run never leaves a truncated file behind."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def resized_frame(path: Path) -> Path:
+    """Downscale and recompress a frame once, caching the JPEG under <frames_dir>/_resized/."""
+    resized = path.parent / "_resized" / f"{frame_cache_name(path)}.jpg"
+    if not resized.exists():
+        resized.parent.mkdir(exist_ok=True)
+        buf = io.BytesIO()
+        with Image.open(path) as img:
+            img.thumbnail((FRAME_MAX_DIM, FRAME_MAX_DIM), Image.LANCZOS)
+            img.convert("RGB").save(buf, "JPEG", quality=FRAME_JPEG_QUALITY, optimize=True)
+        write_atomic(resized, buf.getvalue())
+    return resized
+
+
+def prepare_frame(path: Path) -> bytes:
+    """Return the downscaled JPEG bytes for a frame."""
+    return resized_frame(path).read_bytes()
+
+
+def estimate_frame_tokens(path: Path) -> int:
+    """Estimate the vision token cost of a prepared frame from its 512px tile count."""
+    with Image.open(resized_frame(path)) as img:
+        width, height = img.size
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def b64_frame(path: Path) -> bytes:
+    """Base64-encode a prepared frame, caching the result in a .jpg.b64 sidecar."""
+    resized = resized_frame(path)
+    sidecar = resized.with_name(f"{resized.name}.b64")
+    if sidecar.exists():
+        return sidecar.read_bytes()
+    b64 = base64.b64encode(resized.read_bytes())
+    write_atomic(sidecar, b64)
+    return b64
+
+
+async def call_vision_api(client: httpx.AsyncClient, frames: list[Path], transcript_chunk: str, api_url: str, text_only: bool = False, bucket: TokenBucket | None = None) -> dict:
     """
     OpenAI-compatible Vision call using chat/completions.
     Encodes each frame as base64 and sends as image_url with data URI.
     If text_only=True, skips images and only uses transcript.
     """
-    headers = {"Authorization": f"Bearer {api_key}"}
-    images = []
+    parts = []
     if not text_only:
-        for f in frames:
-            b64 = base64.b64encode(f.read_bytes()).decode("utf-8")
-            images.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}})
-
-    system_prompt = (
-        "You are an educational content analyzer. Your task is to extract mathematical problem-solving content from tutorial video frames.\n\n"
-        "For each frame, identify and extract:\n"
-        "1. Question text: Any problem statement, including multiple choice options (A, B, C, D) if visible\n"
-        "2. Visual elements: Diagrams, tables, circular tracks, speed/distance relationships shown\n"
-        "3. Solution steps: Any mathematical steps, formulas, or reasoning shown on screen\n"
-        "4. Answer: The final answer or option selected if visible\n\n"
-        "Format your response clearly, preserving all numerical values and relationships exactly as shown."
-    )
-    user_content = []
-    if not text_only:
-        user_content.extend(images)
+        # Resize/encode frames in worker threads (Pillow and b64encode release the GIL)
+        # so other batches' requests keep flowing on the event loop meanwhile
+        encoded = await asyncio.gather(*(asyncio.to_thread(b64_frame, f) for f in frames))
+        # Base64 is JSON-safe, so image parts are spliced in as raw bytes with no str round-trip
+        for b64 in encoded:
+            parts.append(_IMAGE_PART_PREFIX + b64 + _IMAGE_PART_SUFFIX)
     
     if text_only:
-        prompt_text = f"Below is a transcript from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
-        prompt_text += f"Please analyze the transcript and extract:\n"
-        prompt_text += f"- The problem/question discussed\n"
-        prompt_text += f"- Any mathematical concepts, formulas, or relationships mentioned\n"
-        prompt_text += f"- Solution steps or explanations provided\n"
-        prompt_text += f"- The answer if mentioned\n\n"
-        prompt_text += f"Transcript:\n{transcript_chunk}"
+        prompt_text = TEXT_ONLY_PROMPT + transcript_chunk
     else:
-        prompt_text = f"These are screenshots from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
-        prompt_text += f"Please analyze the frame(s) and extract:\n"
-        prompt_text += f"- The problem/question shown\n"
-        prompt_text += f"- Any diagrams or visual representations\n"
-        prompt_text += f"- Solution steps or explanations visible\n"
-        prompt_text += f"- The answer if shown\n\n"
-        prompt_text += f"Transcript context: {transcript_chunk[:300] if len(transcript_chunk) > 300 else transcript_chunk}"
+        prompt_text = FRAME_PROMPT + transcript_chunk
     
-    user_content.append({
-        "type": "text", 
-        "text": prompt_text
-    })
-
-    payload = {
-        "model": "gpt-4o-mini",  # Using gpt-4o-mini for vision (cheaper than gpt-4o)
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content},
-        ],
-        "max_tokens": 800,
-        "temperature": 0.2,
-    }
+    parts.append(orjson.dumps({"type": "text", "text": prompt_text}))
+
+    # Splice the user message into the pre-serialized request; retries resend the same bytes
+    body = _PAYLOAD_PREFIX + b'{"role":"user","content":[' + b",".join(parts) + b"]}]}"
+
+    # Calls run concurrently, so every log line is printed whole and tagged with its first frame
+    label = frames[0].name if frames else "batch"
 
     # Retry logic with exponential backoff for rate limits and timeouts
     max_retries = 10  # Increased retries
     base_wait = 30  # Start with 30 seconds (more conservative)
     for attempt in range(max_retries):
         try:
-            resp = httpx.post(api_url, headers=headers, json=payload, timeout=300)
+            resp = await client.post(api_url, content=body)
             
             # Log rate limit info (for debugging)
             if resp.status_code != 429:
                 remaining_req = resp.headers.get("x-ratelimit-remaining-requests", "?")
                 remaining_tok = resp.headers.get("x-ratelimit-remaining-tokens", "?")
                 if attempt == 0:  # Only log on first attempt to avoid spam
-                    print(f"[RPM:{remaining_req} TPM:{remaining_tok}]", end=" ", flush=True)
+                    print(f"{label}: [RPM:{remaining_req} TPM:{remaining_tok}]", flush=True)
             
             if resp.status_code == 429:
                 # Rate limited - check response for retry-after header and rate limit info
@@ -106,22 +235,24 @@ def call_vision_api(frames: list[Path], transcript_chunk: str, api_url: str, api
                 remaining_req = resp.headers.get("x-ratelimit-remaining-requests", "0")
                 remaining_tok = resp.headers.get("x-ratelimit-remaining-tokens", "0")
                 
-                print(f"\n[Rate Limit Info] RPM:{remaining_req}/{limit_req} TPM:{remaining_tok}/{limit_tok}", end=" ", flush=True)
+                rate_info = f"{label}: [Rate Limit Info] RPM:{remaining_req}/{limit_req} TPM:{remaining_tok}/{limit_tok}"
                 
                 if retry_after:
                     wait_time = int(retry_after) + 5  # Add buffer
-                    print(f"API says wait {retry_after}s. Waiting {wait_time}s...", end=" ", flush=True)
+                    print(f"{rate_info} API says wait {retry_after}s. Waiting {wait_time}s...", flush=True)
                 else:
                     wait_time = min((2 ** attempt) * base_wait, 300)  # Cap at 5 minutes
-                    print(f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...", end=" ", flush=True)
+                    print(f"{rate_info} Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...", flush=True)
                 
                 if attempt < max_retries - 1:
-                    time.sleep(wait_time)
+                    await asyncio.sleep(wait_time)
                     continue
                 else:
                     error_body = resp.text[:500] if resp.text else "No error details"
                     raise Exception(f"Rate limit exceeded after {max_retries} retries. Last error: {error_body}")
             resp.raise_for_status()
+            if bucket is not None:
+                bucket.sync(resp.headers)
             return resp.json()
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 429 and attempt < max_retries - 1:
@@ -131,27 +262,164 @@ def call_vision_api(frames: list[Path], transcript_chunk: str, api_url: str, api
                 remaining_req = e.response.headers.get("x-ratelimit-remaining-requests", "0")
                 remaining_tok = e.response.headers.get("x-ratelimit-remaining-tokens", "0")
                 
-                print(f"\n[Rate Limit Info] RPM:{remaining_req}/{limit_req} TPM:{remaining_tok}/{limit_tok}", end=" ", flush=True)
+                rate_info = f"{label}: [Rate Limit Info] RPM:{remaining_req}/{limit_req} TPM:{remaining_tok}/{limit_tok}"
                 
                 if retry_after:
                     wait_time = int(retry_after) + 5
-                    print(f"API says wait {retry_after}s. Waiting {wait_time}s...", end=" ", flush=True)
+                    print(f"{rate_info} API says wait {retry_after}s. Waiting {wait_time}s...", flush=True)
                 else:
                     wait_time = min((2 ** attempt) * base_wait, 300)
-                    print(f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...", end=" ", flush=True)
-                time.sleep(wait_time)
+                    print(f"{rate_info} Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...", flush=True)
+                await asyncio.sleep(wait_time)
                 continue
             raise
         except (httpx.TimeoutException, httpx.ReadTimeout):
             if attempt < max_retries - 1:
                 wait_time = min((2 ** attempt) * base_wait, 300)
-                print(f"Timeout. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...", end=" ", flush=True)
-                time.sleep(wait_time)
+                print(f"{label}: Timeout. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...", flush=True)
+                await asyncio.sleep(wait_time)
                 continue
             raise
     raise Exception("Max retries exceeded for rate limiting/timeouts")
 
 
+def load_transcript_events(transcript: dict | None) -> list[tuple[float, str]]:
+    """Fetch the json3 caption track and return (start_seconds, text) events; [] if unavailable."""
+    if not isinstance(transcript, dict):
+        return []
+    for track in transcript.get("tracks") or ():
+        if track.get("ext") != "json3" or not track.get("url"):
+            continue
+        try:
+            resp = httpx.get(track["url"], timeout=10, follow_redirects=True)
+            resp.raise_for_status()
+            data = orjson.loads(resp.content)
+        except (httpx.HTTPError, orjson.JSONDecodeError):
+            continue
+        events = []
+        for event in data.get("events") or ():
+            text = "".join(seg.get("utf8", "") for seg in event.get("segs") or ()).strip()
+            if text:
+                events.append((event.get("tStartMs", 0) / 1000, text))
+        return events
+    return []
+
+
+def frame_time(frame: Path, frame_seconds: int) -> float:
+    """Timestamp of an ffmpeg frame_%05d.jpg (numbered from 1) in seconds."""
+    return (int(frame.stem.split("_")[1]) - 1) * frame_seconds
+
+
+def transcript_chunks(
+    batches: list[tuple[int, list[Path]]], events: list[tuple[float, str]], frame_seconds: int, context_seconds: int
+) -> dict[int, str]:
+    """Map each batch index to the caption text spoken around its frames."""
+    starts = [start for start, _ in events]
+    chunks = {}
+    for idx, frame_batch in batches:
+        lo = bisect.bisect_left(starts, frame_time(frame_batch[0], frame_seconds) - context_seconds)
+        hi = bisect.bisect_right(starts, frame_time(frame_batch[-1], frame_seconds) + context_seconds)
+        chunks[idx] = " ".join(text for _, text in events[lo:hi])
+    return chunks
+
+
+def read_zst(path: Path) -> tuple[bytes, bool]:
+    """Decompress a (possibly multi-frame) .zst file; returns (data, intact).
+
+    intact is False when the last frame never reached its end marker (a killed writer);
+    data then holds everything decoded up to that point. A corrupt frame raises zstd.ZstdError.
+    """
+    data = path.read_bytes()
+    out = bytearray()
+    while data:
+        dobj = zstd.ZstdDecompressor().decompressobj()
+        out += dobj.decompress(data)
+        if not dobj.eof:
+            return bytes(out), False
+        data = dobj.unused_data
+    return bytes(out), True
+
+
+def load_done_frames(out_file: Path) -> set[str]:
+    """Return frame names already written to out_file, dropping any partial trailing record."""
+    done = set()
+    if not out_file.exists():
+        return done
+    if out_file.suffix == ".zst":
+        try:
+            raw, intact = read_zst(out_file)
+        except zstd.ZstdError as e:
+            # Rewriting from a partial decode would throw away paid-for records, so leave the file alone
+            raise SystemExit(f"❌ {out_file} is corrupt ({e}); move it aside before resuming") from e
+    else:
+        raw, intact = out_file.read_bytes(), True
+    end = raw.rfind(b"\n") + 1
+    if end < len(raw) or not intact:
+        # A crash mid-write left a partial record or an unterminated zstd frame; keep every
+        # complete record, closed off, so appends start on a fresh line (and a fresh frame)
+        if out_file.suffix == ".zst":
+            tmp = out_file.with_suffix(".tmp")
+            tmp.write_bytes(zstd.ZstdCompressor(level=3).compress(raw[:end]))
+            if read_zst(tmp) != (raw[:end], True):
+                tmp.unlink()
+                raise SystemExit(f"❌ Could not rewrite {out_file} without losing records; move it aside before resuming")
+            os.replace(tmp, out_file)
+        else:
+            with out_file.open("r+b") as f:
+                f.truncate(end)
+    for line in raw[:end].splitlines():
+        try:
+            done.update(orjson.loads(line)["frames"])
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            continue
+    return done
+
+
+def open_drafts_writer(out_file: Path) -> BinaryIO:
+    """Open out_file for appending; .zst files get a streaming zstd compressor (new frame per run)."""
+    if out_file.suffix == ".zst":
+        return zstd.ZstdCompressor(level=3).stream_writer(out_file.open("ab"))
+    return out_file.open("ab")
+
+
+async def run_batches(args, batches: list[tuple[int, list[Path]]], chunks: dict[int, str], out_fh: BinaryIO) -> int:
+    """Run vision calls concurrently, bounded by --max-concurrency and paced by the TPM bucket."""
+    bucket = TokenBucket(args.tpm)
+    semaphore = asyncio.Semaphore(args.max_concurrency)
+    mode_str = "text-only" if args.text_only else "frames"
+
+    # One pooled HTTP/2 client for the whole run so TLS is negotiated once
+    client = httpx.AsyncClient(
+        http2=True,
+        headers={"Authorization": f"Bearer {args.api_key}", "Content-Type": "application/json"},
+        timeout=httpx.Timeout(300.0, connect=10.0),
+    )
+
+    async def process(idx: int, frame_batch: list[Path]) -> int:
+        if args.text_only:
+            estimated_tokens = TEXT_ONLY_TOKENS
+        else:
+            frame_tokens = await asyncio.gather(*(asyncio.to_thread(estimate_frame_tokens, f) for f in frame_batch))
+            estimated_tokens = REQUEST_OVERHEAD_TOKENS + sum(frame_tokens)
+        async with semaphore:
+            await bucket.acquire(estimated_tokens)
+            draft = await call_vision_api(client, frame_batch, chunks[idx], args.api_url, text_only=args.text_only, bucket=bucket)
+        result = {"batch": idx, "frames": [f.name for f in frame_batch], "draft": draft}
+        # Write as each batch completes so we can monitor progress; the write
+        # never yields to the event loop, so concurrent batches cannot interleave lines.
+        # fsync so a crash never loses a paid-for result.
+        out_fh.write(orjson.dumps(result) + b"\n")
+        out_fh.flush()  # for zstd this ends a block so everything written so far is decodable
+        os.fsync(out_fh.fileno())
+        return idx
+
+    async with client:
+        for done in asyncio.as_completed([process(idx, frame_batch) for idx, frame_batch in batches]):
+            idx = await done
+            print(f"Batch {idx + 1} ({mode_str}) ✓", flush=True)
+    return len(batches)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Vision extraction stub.")
     parser.add_argument("--frames-dir", type=Path, required=True)
@@ -163,48 +431,56 @@ def main():
     parser.add_argument("--skip-frames", type=int, default=0, help="Skip first N frames (to skip intro/logo frames)")
     parser.add_argument("--initial-wait", type=int, default=0, help="Wait N seconds before starting (to let rate limits reset)")
     parser.add_argument("--text-only", action="store_true", help="Skip images, only use transcript (for testing)")
+    parser.add_argument("--frame-seconds", type=int, default=2, help="Seconds between extracted frames (ingest --every-seconds)")
+    parser.add_argument("--context-seconds", type=int, default=15, help="Transcript seconds to include around each batch")
+    parser.add_argument("--compress", action="store_true", help="Write zstd-compressed drafts (.jsonl.zst)")
+    parser.add_argument("--max-concurrency", type=int, default=3, help="Max API requests in flight at once")
+    parser.add_argument("--tpm", type=int, default=200_000, help="Tokens-per-minute budget to pace requests against")
     args = parser.parse_args()
     
     if args.initial_wait > 0:
         print(f"Waiting {args.initial_wait} seconds for rate limit window to reset...")
         time.sleep(args.initial_wait)
 
-    transcript_text = ""
+    transcript = {}
     if args.transcript_json and args.transcript_json.exists():
-        meta = json.loads(args.transcript_json.read_text())
-        transcript_text = json.dumps(meta.get("transcript", {}))
+        meta = orjson.loads(args.transcript_json.read_bytes())
+        transcript = meta.get("transcript", {})
+    events = load_transcript_events(transcript)
 
     args.out.mkdir(parents=True, exist_ok=True)
-    out_file = args.out / f"{args.frames_dir.name}_drafts.jsonl"
+    out_file = args.out / f"{args.frames_dir.name}_drafts.jsonl{'.zst' if args.compress else ''}"
     
-    # Open file in append mode for incremental writing
-    frames_list = sorted(args.frames_dir.glob("frame_*.jpg"))
+    frames_list = list_frames(args.frames_dir)
     total_frames = len(frames_list)
     print(f"Found {total_frames} frames. Skipping first {args.skip_frames} frames. Processing in batches of 1...")
     
-    batch_count = 0
-    for idx, frame_batch in enumerate(batched_frames(args.frames_dir, skip=args.skip_frames)):
-        if args.max_batches and idx >= args.max_batches:
-            print(f"Stopping at {args.max_batches} batches (limit reached)")
-            break
-        batch_count += 1
-        mode_str = "text-only" if args.text_only else f"{len(frame_batch)} frames"
-        print(f"Processing batch {idx + 1} ({mode_str})...", end=" ", flush=True)
-        chunk = transcript_text  # Simple pass-through; later chunk per timecodes.
-        draft = call_vision_api(frame_batch, chunk, args.api_url, args.api_key, text_only=args.text_only)
-        result = {"batch": idx, "frames": [f.name for f in frame_batch], "draft": draft}
-        # Write incrementally so we can monitor progress
-        with out_file.open("a") as f:
-            f.write(json.dumps(result) + "\n")
-        print("✓")
-        # Rate limiting: wait time depends on mode
-        if args.text_only:
-            # Text-only uses much fewer tokens (~1-2K), so we can go faster
-            time.sleep(2)  # 30 requests/minute = safe for text-only
-        else:
-            # With ~37K tokens per request, we need: 200K TPM / 37K = ~5.4 req/min max
-            # 25s = 2.4 req/min = ~89K tokens/min (safe margin)
-            time.sleep(25)
+    # Resume: skip batches whose frames were already written by a previous run
+    done_frames = load_done_frames(out_file)
+    batches = []
+    skipped = 0
+    for idx, frame_batch in enumerate(batched_frames(frames_list, skip=args.skip_frames)):
+        if all(f.name in done_frames for f in frame_batch):
+            skipped += 1
+            continue
+        batches.append((idx, frame_batch))
+    if skipped:
+        print(f"Resuming: {skipped} batches already in {out_file}, skipping them")
+    if args.max_batches and len(batches) > args.max_batches:
+        print(f"Stopping at {args.max_batches} batches (limit reached)")
+        batches = batches[:args.max_batches]
+
+    # Build each batch's transcript context once, aligned to the frames' timecodes
+    if events:
+        chunks = transcript_chunks(batches, events, args.frame_seconds, args.context_seconds)
+    else:
+        # No timed captions: fall back to the raw transcript metadata as context
+        transcript_text = json.dumps(transcript)
+        fallback = transcript_text if args.text_only else transcript_text[:300]
+        chunks = {idx: fallback for idx, _ in batches}
+
+    with open_drafts_writer(out_file) as out_fh:
+        batch_count = asyncio.run(run_batches(args, batches, chunks, out_fh))
 
     print(f"Completed! Wrote {batch_count} batches to {out_file}")
 
@@ -1,182 +1,618 @@
 """
 OPTIMIZED VISION EXTRACTION - Cost-effective approach:
 1. Process transcript first (text-only, cheap)
-2. Only process frames every 30 seconds (key moments)
+2. Only process key frames: one per distinct slide (pHash dedup), or every 30 seconds
 3. Combine transcript + visual info intelligently
 """
 
 import argparse
-import json
+import asyncio
+import hashlib
+import io
+import math
+import multiprocessing
+import os
+import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable
+from typing import BinaryIO, Iterable
 
 import base64
 import httpx
+import imagehash
+import orjson
+from PIL import Image
 
 
-def get_frame_interval(frames_dir: Path, interval_seconds: int = 30) -> list[Path]:
+MODEL = "gpt-4o-mini"
+
+# Prompts and payload skeletons are built once; calls only fill in the per-request parts
+TEXT_SYSTEM_PROMPT = (
+    "You are an educational content analyzer. Extract mathematical problem-solving content from tutorial video transcripts.\n\n"
+    "For the transcript, identify and extract:\n"
+    "1. Question text: Problem statements, including multiple choice options (A, B, C, D) if mentioned\n"
+    "2. Mathematical concepts: Formulas, relationships, speed/distance/time calculations\n"
+    "3. Solution steps: Step-by-step explanations and reasoning\n"
+    "4. Answer: Final answer or selected option if mentioned\n\n"
+    "Format your response clearly, preserving all numerical values and relationships exactly as mentioned."
+)
+TEXT_USER_PREFIX = (
+    "Below is a transcript from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
+    "Please analyze the transcript and extract:\n"
+    "- The problem/question discussed\n"
+    "- Any mathematical concepts, formulas, or relationships mentioned\n"
+    "- Solution steps or explanations provided\n"
+    "- The answer if mentioned\n\n"
+    "Transcript:\n"
+)
+_TEXT_SYSTEM_MSG = {"role": "system", "content": TEXT_SYSTEM_PROMPT}
+_TEXT_PAYLOAD = {
+    "model": MODEL,
+    "max_tokens": 1000,
+    "temperature": 0.2,
+}
+
+VISION_SYSTEM_PROMPT = (
+    "You are an educational content analyzer. Extract mathematical problem-solving content from tutorial video frames.\n\n"
+    "For each frame, identify and extract:\n"
+    "1. Question text: Any problem statement, including multiple choice options (A, B, C, D) if visible\n"
+    "2. Visual elements: Diagrams, tables, circular tracks, speed/distance relationships shown\n"
+    "3. Solution steps: Any mathematical steps, formulas, or reasoning shown on screen\n"
+    "4. Answer: The final answer or option selected if visible\n\n"
+    "Preserve all numerical values and relationships exactly as shown."
+)
+# {count} is the number of frames in the batch; the transcript chunk is appended
+VISION_USER_TEMPLATE = (
+    "These are {count} consecutive key frames from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
+    "For each frame, in order, extract:\n"
+    "- question: The problem/question shown\n"
+    "- diagram: Any diagrams or visual representations\n"
+    "- steps: Solution steps or explanations visible\n"
+    "- answer: The answer if shown\n\n"
+    'Respond with a JSON object {{"frames": [...]}} holding one object per frame, in order, '
+    "each with the fields frame_index (starting at 0), question, diagram, steps and answer.\n\n"
+    "Transcript context: "
+)
+_VISION_SYSTEM_MSG = {"role": "system", "content": VISION_SYSTEM_PROMPT}
+# Completion budget per frame in a batched vision call
+VISION_MAX_TOKENS_PER_FRAME = 800
+_VISION_PAYLOAD = {
+    "model": MODEL,
+    "temperature": 0.2,
+    "response_format": {"type": "json_object"},
+}
+
+
+@dataclass
+class Frame:
+    """A frame file with the hashes every later step needs, computed from a single read."""
+    path: Path
+    sha256: str
+    phash: imagehash.ImageHash
+
+    @classmethod
+    def from_path(cls, path: Path) -> "Frame":
+        # Small Hamming distances between pHashes mean visually the same slide
+        data = path.read_bytes()
+        with Image.open(io.BytesIO(data)) as img:
+            phash = imagehash.phash(img)
+        return cls(path, hashlib.sha256(data).hexdigest(), phash)
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+# gpt-4o-mini vision pricing: a flat base per image, plus per 512px tile at high detail
+IMAGE_BASE_TOKENS = 2_833
+IMAGE_TILE_TOKENS = 5_667
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at per_minute / 60 per second."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount: int) -> None:
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def sync(self, limit: str | None, remaining: str | None) -> None:
+        """Adopt the server's view of this budget, if it reported one."""
+        try:
+            limit, remaining = int(limit), int(remaining)
+        except (TypeError, ValueError):
+            return
+        self.capacity = limit
+        self.rate = limit / 60
+        self.tokens = float(remaining)
+        self.updated = time.monotonic()
+
+
+class RateLimiter:
+    """Paces API calls against both the requests-per-minute and tokens-per-minute budgets."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    async def acquire(self, tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+    def sync(self, headers: httpx.Headers) -> None:
+        """Resync both buckets from the x-ratelimit-* headers OpenAI sends with each response."""
+        self.requests.sync(headers.get("x-ratelimit-limit-requests"), headers.get("x-ratelimit-remaining-requests"))
+        self.tokens.sync(headers.get("x-ratelimit-limit-tokens"), headers.get("x-ratelimit-remaining-tokens"))
+
+
+def estimate_image_tokens(max_dim: int, detail: str) -> int:
+    """Upper-bound vision tokens for one frame downscaled to max_dim."""
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * math.ceil(max_dim / 512) ** 2
+
+
+def get_frame_interval(frames_dir: Path, interval_seconds: int = 30, dedup_threshold: int = 8) -> tuple[list[Frame], int]:
     """
-    Get frames at specified intervals (e.g., every 30 seconds).
-    Assumes frames were extracted every 2 seconds (from ingest_youtube.py).
-    So every 30 seconds = every 15th frame (30/2 = 15).
+    Get key frames: one per visually distinct slide, or at fixed intervals when dedup is off.
+    With dedup_threshold > 0, a frame is kept only when its pHash differs from the last kept
+    frame by more than the threshold, so long static slides cost one call and quick slide
+    changes are not skipped.
+    With dedup_threshold = 0, frames are taken every interval_seconds. This assumes frames
+    were extracted every 2 seconds (from ingest_youtube.py), so every 30 seconds = every
+    15th frame (30/2 = 15).
+    Returns the selected frames and the total frame count, so callers need not list the directory again.
+    Each selected frame carries its SHA256 and pHash, so it is read once here and not again for the cache key.
     """
-    all_frames = sorted(frames_dir.glob("frame_*.jpg"))
+    # scandir yields names without building a Path per entry, and plain str sort is cheaper than Path sort
+    names = sorted(e.name for e in os.scandir(frames_dir) if e.name.startswith("frame_") and e.name.endswith(".jpg"))
+    all_frames = [frames_dir / name for name in names]
     if not all_frames:
-        return []
-    
-    # Frames are extracted every 2 seconds, so interval_seconds/2 = frame skip
-    frame_skip = max(1, interval_seconds // 2)  # Every 15 frames for 30 seconds
+        return [], 0
     
     # Also skip first few frames (intro/logo)
     skip_intro = 5  # Skip first ~10 seconds
     
-    selected_frames = []
-    for i in range(skip_intro, len(all_frames), frame_skip):
-        selected_frames.append(all_frames[i])
+    if dedup_threshold > 0:
+        candidates = all_frames[skip_intro:]
+    else:
+        # Frames are extracted every 2 seconds, so interval_seconds/2 = frame skip
+        frame_skip = max(1, interval_seconds // 2)  # Every 15 frames for 30 seconds
+        candidates = all_frames[skip_intro::frame_skip]
+    
+    # Hashing decodes every image and is CPU-bound, so spread it across cores. Spawned
+    # workers, because this runs in a thread beside the live event loop and HTTP/2 client,
+    # and forking a multi-threaded process can deadlock the child.
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+        frames = list(pool.map(Frame.from_path, candidates, chunksize=16))
+    if dedup_threshold <= 0:
+        return frames, len(all_frames)
     
-    return selected_frames
+    selected_frames = []
+    last_kept = None
+    for frame in frames:
+        if last_kept is None or frame.phash - last_kept > dedup_threshold:
+            selected_frames.append(frame)
+            last_kept = frame.phash
+    return selected_frames, len(all_frames)
+
+
+def prepare_frame(path: Path, max_dim: int = 1024) -> bytes:
+    """Downscale a frame to max_dim on its long edge and recompress it as JPEG."""
+    with Image.open(path) as img:
+        img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=80, optimize=True)
+    return buf.getvalue()
+
+
+def encode_frames(frames: list[Frame], max_dim: int) -> list[str]:
+    """Downscale frames and build their base64 data URLs: fewer bytes to upload and fewer vision tokens billed."""
+    # Base64 output is pure ASCII, so the cheaper ascii codec is safe
+    return ["data:image/jpeg;base64," + base64.b64encode(prepare_frame(frame.path, max_dim)).decode("ascii") for frame in frames]
+
+
+def cache_key(*parts: str | bytes) -> str:
+    """Hash the inputs that determine an API response; any prompt or frame change gives a new key."""
+    return hashlib.sha256(b"\0".join(p.encode() if isinstance(p, str) else p for p in parts)).hexdigest()
+
+
+def cache_load(cache_dir: Path | None, key: str) -> dict | None:
+    """Return a cached API response, or None on a miss or when caching is disabled."""
+    if cache_dir is None:
+        return None
+    cache_file = cache_dir / f"{key}.json"
+    if not cache_file.exists():
+        return None
+    try:
+        return orjson.loads(cache_file.read_bytes())
+    except orjson.JSONDecodeError:
+        # Unreadable entry (e.g. written by an older, interrupted run); refetch and overwrite it
+        return None
+
+
+def cache_store(cache_dir: Path | None, key: str, response: dict) -> None:
+    """Persist a successful API response under its content hash."""
+    if cache_dir is None:
+        return
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Temp file + os.replace so a run killed mid-write never leaves a truncated entry
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(response))
+        os.replace(tmp, cache_dir / f"{key}.json")
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def retry_wait(resp: httpx.Response, attempt: int, base_wait: int, max_wait: int) -> float:
+    """Seconds to wait before retrying: the server's retry-after when given, else exponential backoff."""
+    retry_after = resp.headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min((2 ** attempt) * base_wait, max_wait)
 
 
-def call_text_api(transcript_text: str, api_url: str, api_key: str) -> dict:
+async def call_text_api(client: httpx.AsyncClient, transcript_text: str, api_url: str, api_key: str, cache_dir: Path | None = None, limiter: RateLimiter | None = None) -> dict:
     """Call API with text-only (transcript) - much cheaper."""
-    headers = {"Authorization": f"Bearer {api_key}"}
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     
-    system_prompt = (
-        "You are an educational content analyzer. Extract mathematical problem-solving content from tutorial video transcripts.\n\n"
-        "For the transcript, identify and extract:\n"
-        "1. Question text: Problem statements, including multiple choice options (A, B, C, D) if mentioned\n"
-        "2. Mathematical concepts: Formulas, relationships, speed/distance/time calculations\n"
-        "3. Solution steps: Step-by-step explanations and reasoning\n"
-        "4. Answer: Final answer or selected option if mentioned\n\n"
-        "Format your response clearly, preserving all numerical values and relationships exactly as mentioned."
-    )
+    user_content = TEXT_USER_PREFIX + transcript_text
     
-    user_content = (
-        f"Below is a transcript from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
-        f"Please analyze the transcript and extract:\n"
-        f"- The problem/question discussed\n"
-        f"- Any mathematical concepts, formulas, or relationships mentioned\n"
-        f"- Solution steps or explanations provided\n"
-        f"- The answer if mentioned\n\n"
-        f"Transcript:\n{transcript_text}"
-    )
+    key = cache_key(orjson.dumps(_TEXT_PAYLOAD), TEXT_SYSTEM_PROMPT, user_content)
+    cached = cache_load(cache_dir, key)
+    if cached is not None:
+        return cached
     
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content},
-        ],
-        "max_tokens": 1000,
-        "temperature": 0.2,
-    }
+    payload = {**_TEXT_PAYLOAD, "messages": [_TEXT_SYSTEM_MSG, {"role": "user", "content": user_content}]}
+    body = orjson.dumps(payload)
+    
+    # Prompt tokens (~4 chars each) plus the completion budget
+    estimated_tokens = (len(TEXT_SYSTEM_PROMPT) + len(user_content)) // 4 + payload["max_tokens"]
     
     # Retry logic
     max_retries = 5
     base_wait = 5
     for attempt in range(max_retries):
         try:
-            resp = httpx.post(api_url, headers=headers, json=payload, timeout=60)
+            if limiter is not None:
+                await limiter.acquire(estimated_tokens)
+            resp = await client.post(api_url, headers=headers, content=body, timeout=60)
             if resp.status_code == 429:
-                wait_time = min((2 ** attempt) * base_wait, 60)
+                wait_time = retry_wait(resp, attempt, base_wait, 60)
                 if attempt < max_retries - 1:
                     print(f"Rate limited. Waiting {wait_time}s...", end=" ", flush=True)
-                    time.sleep(wait_time)
+                    await asyncio.sleep(wait_time)
                     continue
             resp.raise_for_status()
-            return resp.json()
+            if limiter is not None:
+                limiter.sync(resp.headers)
+            result = orjson.loads(resp.content)
+            cache_store(cache_dir, key, result)
+            return result
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 429 and attempt < max_retries - 1:
-                wait_time = min((2 ** attempt) * base_wait, 60)
+                wait_time = retry_wait(e.response, attempt, base_wait, 60)
                 print(f"Rate limited. Waiting {wait_time}s...", end=" ", flush=True)
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
                 continue
             raise
         except (httpx.TimeoutException, httpx.ReadTimeout):
             if attempt < max_retries - 1:
                 wait_time = min((2 ** attempt) * base_wait, 60)
                 print(f"Timeout. Waiting {wait_time}s...", end=" ", flush=True)
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
                 continue
             raise
     raise Exception("Max retries exceeded")
 
 
-def call_vision_api(frame: Path, transcript_chunk: str, api_url: str, api_key: str) -> dict:
-    """Call API with single frame + transcript context - only for key moments."""
-    headers = {"Authorization": f"Bearer {api_key}"}
-    
-    # Encode frame
-    b64 = base64.b64encode(frame.read_bytes()).decode("utf-8")
-    
-    system_prompt = (
-        "You are an educational content analyzer. Extract mathematical problem-solving content from tutorial video frames.\n\n"
-        "For this frame, identify and extract:\n"
-        "1. Question text: Any problem statement, including multiple choice options (A, B, C, D) if visible\n"
-        "2. Visual elements: Diagrams, tables, circular tracks, speed/distance relationships shown\n"
-        "3. Solution steps: Any mathematical steps, formulas, or reasoning shown on screen\n"
-        "4. Answer: The final answer or option selected if visible\n\n"
-        "Format your response clearly, preserving all numerical values and relationships exactly as shown."
-    )
+async def call_vision_batch_api(client: httpx.AsyncClient, frame_urls: list[str], transcript_chunk: str, api_url: str, api_key: str, detail: str = "low", image_tokens: int = IMAGE_BASE_TOKENS, limiter: RateLimiter | None = None) -> dict:
+    """Call API with several consecutive key frames (as prebuilt data URLs) + transcript context in a single request."""
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     
     user_content = [
-        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}},
-        {
-            "type": "text",
-            "text": (
-                f"This is a key frame from an educational tutorial video about circular tracks problems in CAT Quantitative Aptitude.\n\n"
-                f"Please analyze the frame and extract:\n"
-                f"- The problem/question shown\n"
-                f"- Any diagrams or visual representations\n"
-                f"- Solution steps or explanations visible\n"
-                f"- The answer if shown\n\n"
-                f"Transcript context: {transcript_chunk[:500]}"
-            )
-        }
+        {"type": "image_url", "image_url": {"url": url, "detail": detail}}
+        for url in frame_urls
     ]
+    user_content.append({
+        "type": "text",
+        "text": VISION_USER_TEMPLATE.format(count=len(frame_urls)) + transcript_chunk[:500],
+    })
     
     payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content},
-        ],
-        "max_tokens": 800,
-        "temperature": 0.2,
+        **_VISION_PAYLOAD,
+        "messages": [_VISION_SYSTEM_MSG, {"role": "user", "content": user_content}],
+        "max_tokens": VISION_MAX_TOKENS_PER_FRAME * len(frame_urls),
     }
     
+    # Serialize once: the payload is mostly base64 image data, and retries resend the same bytes
+    body = orjson.dumps(payload)
+    
+    # Every image in the batch counts against TPM, plus the text prompt and completion budget
+    estimated_tokens = image_tokens * len(frame_urls) + (len(VISION_SYSTEM_PROMPT) + len(transcript_chunk)) // 4 + payload["max_tokens"]
+    
     # Retry logic with longer waits for vision (expensive)
     max_retries = 5
     base_wait = 30
     for attempt in range(max_retries):
         try:
-            resp = httpx.post(api_url, headers=headers, json=payload, timeout=300)
+            if limiter is not None:
+                await limiter.acquire(estimated_tokens)
+            resp = await client.post(api_url, headers=headers, content=body, timeout=300)
             if resp.status_code == 429:
-                wait_time = min((2 ** attempt) * base_wait, 300)
+                wait_time = retry_wait(resp, attempt, base_wait, 300)
                 if attempt < max_retries - 1:
                     print(f"Rate limited. Waiting {wait_time}s...", end=" ", flush=True)
-                    time.sleep(wait_time)
+                    await asyncio.sleep(wait_time)
                     continue
             resp.raise_for_status()
-            return resp.json()
+            if limiter is not None:
+                limiter.sync(resp.headers)
+            return orjson.loads(resp.content)
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 429 and attempt < max_retries - 1:
-                wait_time = min((2 ** attempt) * base_wait, 300)
+                wait_time = retry_wait(e.response, attempt, base_wait, 300)
                 print(f"Rate limited. Waiting {wait_time}s...", end=" ", flush=True)
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
                 continue
             raise
         except (httpx.TimeoutException, httpx.ReadTimeout):
             if attempt < max_retries - 1:
                 wait_time = min((2 ** attempt) * base_wait, 300)
                 print(f"Timeout. Waiting {wait_time}s...", end=" ", flush=True)
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
                 continue
             raise
     raise Exception("Max retries exceeded")
 
 
+# Labels match the plain-text replies of single-frame calls, which format_dataset_auto parses
+FRAME_ENTRY_LABELS = (
+    ("question", "Question"),
+    ("diagram", "Diagram"),
+    ("steps", "Steps"),
+    ("answer", "Answer"),
+)
+
+
+def render_frame_entry(entry: dict) -> str:
+    """Render one frame's JSON entry as labeled text: one "Label: value" line per field, steps one per line."""
+    lines = []
+    for field, label in FRAME_ENTRY_LABELS:
+        value = entry.get(field)
+        if not value:
+            continue
+        if isinstance(value, list):
+            value = "\n".join(v if isinstance(v, str) else orjson.dumps(v).decode() for v in value)
+        elif not isinstance(value, str):
+            value = orjson.dumps(value).decode()
+        lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+def split_batch_draft(draft: dict, frame_count: int) -> list[dict] | None:
+    """
+    Split a batched vision response into one response-shaped draft per frame, with each
+    frame's content rendered back to labeled text.
+    Returns None when the reply is not the expected JSON with one entry per frame.
+    """
+    try:
+        choice = draft["choices"][0]
+        entries = orjson.loads(choice["message"]["content"])["frames"]
+    except (KeyError, IndexError, TypeError, orjson.JSONDecodeError):
+        return None
+    if not isinstance(entries, list) or len(entries) != frame_count or not all(isinstance(e, dict) for e in entries):
+        return None
+    return [
+        {**draft, "choices": [{**choice, "message": {**choice["message"], "content": render_frame_entry(entry)}}]}
+        for entry in entries
+    ]
+
+
+async def fetch_track(client: httpx.AsyncClient, track_url: str) -> str | None:
+    """Fetch one caption track, flattening JSON3 events to plain text; None if it is unavailable."""
+    resp = await client.get(track_url, timeout=10, follow_redirects=True)
+    if resp.status_code != 200:
+        return None
+    # Try parsing as JSON3; multi-MB tracks are parsed off the event loop
+    try:
+        data = await asyncio.to_thread(orjson.loads, resp.content)
+    except orjson.JSONDecodeError:
+        # Not JSON, use as text
+        return resp.text
+    # Kept outside the try: a malformed event must not silently turn the raw JSON into the transcript
+    return " ".join(
+        seg["utf8"]
+        for event in data.get("events") or ()
+        for seg in event.get("segs") or ()
+        if isinstance(seg, dict) and "utf8" in seg
+    )
+
+
+async def fetch_transcript(client: httpx.AsyncClient, transcript_data: dict) -> str | None:
+    """Fetch all caption tracks at once and return the first listed one that succeeds."""
+    if not isinstance(transcript_data, dict):
+        return None
+    tracks = transcript_data.get("tracks", [])
+    if not isinstance(tracks, list):
+        return None
+    track_urls = [track.get("url") for track in tracks if isinstance(track, dict) and track.get("url")]
+    
+    # All requests are in flight together, so a slow or dead track no longer delays the
+    # next one; results are still taken in listed order to keep the preferred track
+    tasks = [asyncio.create_task(fetch_track(client, url)) for url in track_urls]
+    try:
+        for task in tasks:
+            try:
+                text = await task
+            except Exception:
+                continue
+            if text is not None:
+                return text
+    finally:
+        for task in tasks:
+            task.cancel()
+    return None
+
+
+def write_record(out_f: BinaryIO, record: dict) -> None:
+    """Append one JSONL record, flushed so results survive a crash mid-run."""
+    out_f.write(orjson.dumps(record) + b"\n")
+    out_f.flush()
+
+
+async def extract(args, transcript_data: dict, out_f: BinaryIO) -> tuple[str, list[Frame]]:
+    """Fetch the transcript, then run the transcript call alongside the key-frame vision calls (bounded concurrency)."""
+    # Responses are cached by content hash, so unchanged inputs cost nothing on a re-run
+    cache_dir = None if args.no_cache else args.cache_dir
+    # Calls are paced by the account's real RPM/TPM budget instead of fixed sleeps
+    limiter = RateLimiter(args.rpm, args.tpm)
+    image_tokens = estimate_image_tokens(args.max_image_dim, args.image_detail)
+    # One pooled HTTP/2 client for the caption fetch and every API call, so TLS is negotiated
+    # once per host. Auth is sent per API request so the key never goes to the caption host.
+    client = httpx.AsyncClient(
+        http2=True,
+        timeout=300,
+        limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+    )
+    async with client:
+        # Extract transcript text - try to fetch, but fallback gracefully
+        transcript_text = await fetch_transcript(client, transcript_data)
+        if transcript_text is None:
+            # Fallback: use metadata as context
+            transcript_text = orjson.dumps(transcript_data).decode()
+            print("⚠️  Could not fetch transcript from URL, using metadata as context")
+        
+        # STEP 1: Process transcript (text-only, cheap). It needs nothing from STEP 2, so it
+        # runs as a task alongside the frame calls instead of ahead of them
+        print("=" * 60)
+        print("STEP 1: Processing transcript (text-only, low cost) in the background...")
+        print("=" * 60)
+        
+        async def transcript_step() -> None:
+            if transcript_text and len(transcript_text) > 100:  # Only if we have meaningful transcript
+                try:
+                    transcript_result = await call_text_api(client, transcript_text, args.api_url, args.api_key, cache_dir=cache_dir, limiter=limiter)
+                    result = {
+                        "type": "transcript",
+                        "source": "text_only",
+                        "draft": transcript_result
+                    }
+                    write_record(out_f, result)
+                    print("Transcript ✓")
+                except Exception as e:
+                    print(f"Transcript ✗ Failed: {e}")
+                    # Continue with frames even if transcript fails
+                    write_record(out_f, {"type": "transcript", "error": str(e)})
+            else:
+                print("⚠️  Skipping transcript (not available or too short)")
+                write_record(out_f, {"type": "transcript", "skipped": True})
+        
+        async def frames_step() -> list[Frame]:
+            # STEP 2: Process key frames (one per distinct slide, expensive but necessary)
+            print("=" * 60)
+            if args.dedup_threshold > 0:
+                print(f"STEP 2: Processing key frames (distinct slides, pHash threshold {args.dedup_threshold})...")
+            else:
+                print(f"STEP 2: Processing key frames (every {args.frame_interval} seconds)...")
+            print("=" * 60)
+            
+            # Frame hashing is CPU-bound; keep it off the event loop so the transcript call proceeds
+            key_frames, total_frames = await asyncio.to_thread(get_frame_interval, args.frames_dir, args.frame_interval, args.dedup_threshold)
+            print(f"Selected {len(key_frames)} key frames from {total_frames} total frames")
+            
+            # Requests are network-bound, so keep several in flight instead of sleeping between them
+            semaphore = asyncio.Semaphore(args.max_concurrency)
+            
+            # Several frames per request amortize the request overhead and the system prompt
+            batches = [(start, key_frames[start : start + args.frames_per_call]) for start in range(0, len(key_frames), args.frames_per_call)]
+            
+            # Frames are encoded before a request slot is taken, so the next batches are ready
+            # while earlier requests are in flight; the prefetch bound caps encoded batches in memory
+            prefetch = asyncio.Semaphore(args.max_concurrency + 2)
+            
+            async def process(start: int, batch: list[Frame]) -> tuple[int, list[Frame]]:
+                # Use relevant transcript chunk (first 500 chars for context)
+                transcript_chunk = transcript_text[:500]
+                # Everything in the request except the image bytes, which the frame hashes stand in for
+                key = cache_key(
+                    orjson.dumps(_VISION_PAYLOAD), VISION_SYSTEM_PROMPT, VISION_USER_TEMPLATE.format(count=len(batch)),
+                    str(VISION_MAX_TOKENS_PER_FRAME * len(batch)), *(f.sha256 for f in batch),
+                    str(args.max_image_dim), args.image_detail, transcript_chunk,
+                )
+                batch_result = cache_load(cache_dir, key)
+                if batch_result is None:
+                    async with prefetch:
+                        frame_urls = await asyncio.to_thread(encode_frames, batch, args.max_image_dim)
+                        async with semaphore:
+                            batch_result = await call_vision_batch_api(
+                                client, frame_urls, transcript_chunk, args.api_url, args.api_key, detail=args.image_detail,
+                                image_tokens=image_tokens, limiter=limiter,
+                            )
+                    cache_store(cache_dir, key, batch_result)
+                frame_drafts = split_batch_draft(batch_result, len(batch))
+                if frame_drafts is not None:
+                    results = [
+                        {
+                            "type": "frame",
+                            "source": "vision",
+                            "frame": frame.name,
+                            "draft": frame_draft
+                        }
+                        for frame, frame_draft in zip(batch, frame_drafts)
+                    ]
+                else:
+                    # Reply could not be split per frame; keep it whole so nothing is lost
+                    results = [{
+                        "type": "frame",
+                        "source": "vision",
+                        "frame": batch[0].name,
+                        "frames": [frame.name for frame in batch],
+                        "draft": batch_result
+                    }]
+                # The write never yields to the event loop, so lines from concurrent batches cannot interleave
+                for result in results:
+                    write_record(out_f, result)
+                return start, batch
+            
+            for done in asyncio.as_completed([process(start, batch) for start, batch in batches]):
+                start, batch = await done
+                print(f"Frames {start + 1}-{start + len(batch)}/{len(key_frames)} ({batch[0].name}..{batch[-1].name}) ✓")
+            
+            return key_frames
+        
+        transcript_task = asyncio.create_task(transcript_step())
+        try:
+            key_frames = [] if args.skip_vision else await frames_step()
+        finally:
+            # Let the transcript result land even if a frame batch failed
+            await transcript_task
+    
+    return transcript_text, key_frames
+
+
 def main():
     parser = argparse.ArgumentParser(description="Optimized vision extraction - transcript-first, frames at intervals.")
     parser.add_argument("--frames-dir", type=Path, required=True)
@@ -185,115 +621,31 @@ def main():
     parser.add_argument("--api-key", required=True)
     parser.add_argument("--out", type=Path, default=Path("data/drafts"))
     parser.add_argument("--frame-interval", type=int, default=30, help="Process frames every N seconds (default: 30)")
+    parser.add_argument("--dedup-threshold", type=int, default=8, help="pHash distance for a frame to count as a new slide; 0 uses --frame-interval instead")
     parser.add_argument("--skip-vision", action="store_true", help="Skip vision API calls, only use transcript")
+    parser.add_argument("--max-image-dim", type=int, default=1024, help="Downscale frames to this long edge before upload")
+    parser.add_argument("--image-detail", choices=["low", "high", "auto"], default="low", help="Vision detail level for frames")
+    parser.add_argument("--cache-dir", type=Path, default=Path("data/cache"), help="Directory for cached API responses")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring and not writing the cache")
+    parser.add_argument("--frames-per-call", type=int, default=4, help="Key frames sent together in one vision request")
+    parser.add_argument("--rpm", type=int, default=500, help="Requests-per-minute budget to pace calls against")
+    parser.add_argument("--tpm", type=int, default=200_000, help="Tokens-per-minute budget to pace calls against")
+    parser.add_argument("--max-concurrency", type=int, default=5, help="Max vision requests in flight at once")
     args = parser.parse_args()
     
     # Load transcript
     if not args.transcript_json.exists():
         raise FileNotFoundError(f"Transcript not found: {args.transcript_json}")
     
-    meta = json.loads(args.transcript_json.read_text())
+    meta = orjson.loads(args.transcript_json.read_bytes())
     transcript_data = meta.get("transcript", {})
     
-    # Extract transcript text - try to fetch, but fallback gracefully
-    transcript_text = ""
-    transcript_available = False
-    
-    if isinstance(transcript_data, dict):
-        tracks = transcript_data.get("tracks", [])
-        if tracks and isinstance(tracks, list) and len(tracks) > 0:
-            # Try to fetch transcript from URL
-            for track in tracks:
-                if isinstance(track, dict):
-                    track_url = track.get("url", "")
-                    if track_url:
-                        try:
-                            resp = httpx.get(track_url, timeout=10, follow_redirects=True)
-                            if resp.status_code == 200:
-                                content = resp.text
-                                # Try parsing as JSON3
-                                try:
-                                    data = json.loads(content)
-                                    text_parts = []
-                                    for event in data.get("events", []):
-                                        for seg in event.get("segs", []):
-                                            if "utf8" in seg:
-                                                text_parts.append(seg["utf8"])
-                                    transcript_text = " ".join(text_parts)
-                                    transcript_available = True
-                                    break
-                                except:
-                                    # Not JSON, use as text
-                                    transcript_text = content
-                                    transcript_available = True
-                                    break
-                        except Exception as e:
-                            continue
-    
-    if not transcript_available:
-        # Fallback: use metadata as context
-        transcript_text = json.dumps(transcript_data)
-        print("⚠️  Could not fetch transcript from URL, using metadata as context")
-    
     args.out.mkdir(parents=True, exist_ok=True)
     out_file = args.out / f"{args.frames_dir.name}_drafts.jsonl"
     
-    # STEP 1: Process transcript (text-only, cheap)
-    print("=" * 60)
-    print("STEP 1: Processing transcript (text-only, low cost)...")
-    print("=" * 60)
-    
-    if transcript_text and len(transcript_text) > 100:  # Only if we have meaningful transcript
-        print("Extracting from transcript...", end=" ", flush=True)
-        try:
-            transcript_result = call_text_api(transcript_text, args.api_url, args.api_key)
-            result = {
-                "type": "transcript",
-                "source": "text_only",
-                "draft": transcript_result
-            }
-            with out_file.open("w") as f:  # Write mode to start fresh
-                f.write(json.dumps(result) + "\n")
-            print("✓")
-            time.sleep(2)  # Small delay between text requests
-        except Exception as e:
-            print(f"✗ Failed: {e}")
-            # Continue with frames even if transcript fails
-            with out_file.open("w") as f:
-                f.write(json.dumps({"type": "transcript", "error": str(e)}) + "\n")
-    else:
-        print("⚠️  Skipping transcript (not available or too short)")
-        with out_file.open("w") as f:
-            f.write(json.dumps({"type": "transcript", "skipped": True}) + "\n")
-    
-    # STEP 2: Process key frames (every 30 seconds, expensive but necessary)
-    if not args.skip_vision:
-        print("\n" + "=" * 60)
-        print(f"STEP 2: Processing key frames (every {args.frame_interval} seconds)...")
-        print("=" * 60)
-        
-        key_frames = get_frame_interval(args.frames_dir, args.frame_interval)
-        print(f"Selected {len(key_frames)} key frames from {len(list(args.frames_dir.glob('frame_*.jpg')))} total frames")
-        
-        for idx, frame in enumerate(key_frames):
-            print(f"Processing frame {idx + 1}/{len(key_frames)} ({frame.name})...", end=" ", flush=True)
-            
-            # Use relevant transcript chunk (first 500 chars for context)
-            frame_result = call_vision_api(frame, transcript_text[:500], args.api_url, args.api_key)
-            
-            result = {
-                "type": "frame",
-                "source": "vision",
-                "frame": frame.name,
-                "draft": frame_result
-            }
-            with out_file.open("a") as f:
-                f.write(json.dumps(result) + "\n")
-            print("✓")
-            
-            # Wait 25 seconds between vision API calls (rate limit safety)
-            if idx < len(key_frames) - 1:  # Don't wait after last frame
-                time.sleep(25)
+    # One handle for the whole run; write mode starts the drafts file fresh
+    with out_file.open("wb") as out_f:
+        transcript_text, key_frames = asyncio.run(extract(args, transcript_data, out_f))
     
     print("\n" + "=" * 60)
     print("✅ EXTRACTION COMPLETE!")
@@ -303,7 +655,10 @@ def main():
     # Cost estimate
     text_cost = 0.00015 * (len(transcript_text) / 4 / 1_000_000)  # ~$0.15 per 1M input tokens
     if not args.skip_vision:
-        vision_cost = len(key_frames) * 0.0055  # ~$0.0055 per frame (37K tokens)
+        if args.image_detail == "low":
+            vision_cost = len(key_frames) * 0.000425  # ~$0.000425 per frame (flat ~2.8K tokens at low detail)
+        else:
+            vision_cost = len(key_frames) * 0.0055  # ~$0.0055 per frame (37K tokens)
         total_cost = text_cost + vision_cost
         print(f"\n💰 Estimated cost:")
         print(f"   Transcript: ~${text_cost:.4f}")
@@ -3,11 +3,10 @@ Test the DILR RAG pipeline with a sample question.
 """
 
 import os
-import json
 from pathlib import Path
 
 from retrieval.embed import embed
-from retrieval.store import VectorStore, load_jsonl
+from retrieval.store import load_or_build
 from retrieval.prompt import build_user_prompt, SYSTEM_PROMPT
 from backend.app import call_llm
 
@@ -24,40 +23,19 @@ def test_dilr_rag():
     
     if store_path.exists():
         print(f"\n📦 Loading vector store from {store_path}...")
-        import pickle
-        with open(store_path, "rb") as f:
-            data = pickle.load(f)
-            store = data["store"]
-            items = data["items"]
-        print(f"✅ Loaded {len(items)} problems from vector store")
     elif data_path.exists():
         print(f"\n📦 Building vector store from {data_path}...")
-        items = load_jsonl(data_path)
-        if not items:
-            print("❌ No items found in data file")
-            return
-        
-        print(f"Embedding {len(items)} problems...")
-        texts = []
-        for it in items:
-            question = it.get("question", "")
-            solutions = it.get("solutions", {})
-            text = f"{question}\n\n"
-            text += f"Direct: {solutions.get('direct', '')}\n"
-            text += f"Step-by-step: {solutions.get('step_by_step', '')}\n"
-            text += f"Intuitive: {solutions.get('intuitive', '')}\n"
-            text += f"Shortcut: {solutions.get('shortcut', '')}"
-            texts.append(text)
-        
-        embeddings = embed(texts)
-        dim = len(embeddings[0])
-        store = VectorStore(dim)
-        store.add(embeddings, items)
-        print(f"✅ Built vector store with {len(items)} problems")
     else:
         print(f"❌ Neither {store_path} nor {data_path} found")
         return
     
+    # Reuses the prebuilt store, else a cached build of the data file, else embeds it once
+    store, items = load_or_build(data_path, store_path)
+    if not items:
+        print("❌ No items found in data file")
+        return
+    print(f"✅ Loaded vector store with {len(items)} problems")
+    
     # Test question
     test_question = """Six friends A, B, C, D, E, and F are sitting around a circular table. 
     A sits opposite to D. B sits to the immediate right of A. C sits between B and E. 
@@ -11,7 +11,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from retrieval.embed import embed
-from retrieval.store import VectorStore, load_jsonl
+from retrieval.store import load_jsonl, load_or_build
 
 
 def test_embeddings():
@@ -64,18 +64,8 @@ def test_retrieval():
         os.environ.setdefault("EMBED_API_URL", "https://api.openai.com/v1/embeddings")
         os.environ.setdefault("EMBED_MODEL", "text-embedding-3-small")
         
-        # Build store
-        texts = []
-        for it in items[:5]:  # Just test with first 5
-            question = it.get("question", "")
-            solutions = it.get("solutions", {})
-            text = f"{question}\n\nDirect: {solutions.get('direct', '')}"
-            texts.append(text)
-        
-        embeddings = embed(texts)
-        dim = len(embeddings[0])
-        store = VectorStore(dim)
-        store.add(embeddings, items[:5])
+        # Build store (cached on disk until the dataset or embedding model changes)
+        store, _ = load_or_build(data_path, limit=5)  # Just test with first 5
         
         # Search
         q_embed = embed([query])[0]